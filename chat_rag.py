@@ -1,15 +1,21 @@
 import argparse
-from env import DOCSTORE_PATH, DOCSTORE_TABLE_NAME, OLLAMA_MODEL, PARENT_DOC_ID
-from utils import get_sqlitestore
+import sys
+from functools import lru_cache
+from typing import Iterator
+from env import DOCSTORE_PATH, DOCSTORE_TABLE_NAME, LLM_CACHE_PATH, PARENT_DOC_ID
+from utils import get_llm, get_sqlitestore, get_quantized_index, QuantizedMultiVectorRetriever
 from utils.get_vectorstore import get_vectorstore
-from langchain_community.llms.ollama import Ollama
-from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain_core.runnables import Runnable
+from langchain_core.runnables import Runnable, RunnableGenerator, RunnableLambda
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain.retrievers.multi_vector import MultiVectorRetriever
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_ollama import OllamaLLM
+from langchain_core.outputs import Generation
+from langchain_core.prompt_values import PromptValue
+from langchain_core.language_models.llms import get_prompts
+from langchain_community.cache import SQLiteCache
 
 def main() -> None:
     """
@@ -76,26 +82,33 @@ def get_question_answering_prompt() -> ChatPromptTemplate:
 
     return qa_prompt
 
+@lru_cache(maxsize=None)
 def get_rag_chain() -> Runnable:
     """
     Creates a Retrieval-Augmented Generation (RAG) chain for answering questions with retrieved context.
 
     This function performs the following steps:
     1. Initializes an LLM and the vector store for retrieving documents.
-    2. Sets up a retriever that combines a vector store and a document store, using similarity search.
+    2. Sets up a retriever that combines a vector store and a document store, using similarity search over int8 quantized embeddings.
     3. Creates a history-aware retriever that uses the LLM to reformulate questions.
     4. Combines the history-aware retriever with the question-answering system to create the final RAG chain.
 
+    The chain does not keep any state between invocations, so it is built once and shared.
+
     Returns:
         Runnable: A RAG chain that can be used for answering questions with retrieved context.
     """
+    # Cache LLM responses on disk, so identical prompts (e.g. repeated questions) skip inference
+    set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+
     llm = get_llm()
 
     vectorstore = get_vectorstore()
     docstore = get_sqlitestore(DOCSTORE_PATH, DOCSTORE_TABLE_NAME)
-    retriever = MultiVectorRetriever(
+    retriever = QuantizedMultiVectorRetriever(
         vectorstore=vectorstore,
         docstore=docstore,
+        index=get_quantized_index(),
         id_key=PARENT_DOC_ID,
         search_type="similarity",
         search_kwargs={"k": 3},
@@ -105,21 +118,58 @@ def get_rag_chain() -> Runnable:
     contextualize_q_prompt = get_contextualize_question_prompt()
 
     # Create a history-aware retriever
-    # This uses the LLM to help reformulate the question based on chat history
+    # This uses the LLM to help reformulate the question based on chat history.
+    # With an empty chat history the question goes straight to the retriever without an LLM call,
+    # and repeated reformulations are served from the LLM cache.
+    # The reformulated question is only used as a whole, so it's invoked rather than streamed to be served from the LLM cache
     history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
+        RunnableLambda(llm.invoke), retriever, contextualize_q_prompt
     )
 
     # Answer the query concisely using retrieved documents.
     qa_prompt = get_question_answering_prompt()
 
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
+    # The answer is streamed, but served from the LLM cache when the same prompt was answered before
+    question_answer_chain = create_stuff_documents_chain(get_cached_stream(llm), qa_prompt)
 
     # Create a retrieval chain that combines the history-aware retriever and the question answering chain
     rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
     return rag_chain
 
+def get_cached_stream(llm: OllamaLLM) -> Runnable:
+    """
+    Wraps an LLM so its responses are streamed while still using the LLM cache.
+
+    LLM.stream never looks up the LLM cache. This looks up the prompt first and yields a cached response in one piece.
+    Otherwise the response is streamed from the LLM and added to the cache once it is complete.
+
+    Args:
+        llm (OllamaLLM): The LLM to stream responses from.
+
+    Returns:
+        Runnable: A runnable taking a prompt and streaming the response text.
+    """
+    def stream(prompts: Iterator[PromptValue]) -> Iterator[str]:
+        cache = get_llm_cache()
+        for prompt in prompts:
+            prompt_text = prompt.to_string()
+            # Look up the prompt with the same key as LLM.invoke without stop words
+            cached, llm_string, _, _ = get_prompts({**llm.dict(), "stop": None}, [prompt_text], cache)
+            if cached:
+                yield "".join(generation.text for generation in cached[0])
+                continue
+
+            response_parts = []
+            for response_part in llm.stream(prompt_text):
+                response_parts.append(response_part)
+                yield response_part
+
+            if cache:
+                cache.update(prompt_text, llm_string, [Generation(text="".join(response_parts))])
+
+    return RunnableGenerator(stream)
+
 def interactive_query_loop() -> None:
     """
     Runs an interactive loop to accept queries from the user until 'exit' or 'q' is entered.
@@ -141,21 +191,23 @@ def interactive_query_loop() -> None:
             print("Chat history has been reset")
             continue
         if query.lower() in {"chat_history", "ch", "history"}:
-            messages = "\n".join([f"{'You' if type(message) == HumanMessage else 'AI'}: \"{message.content}\"" for message in chat_history])
+            messages = "\n".join(f"{'You' if isinstance(message, HumanMessage) else 'AI'}: \"{message.content}\"" for message in chat_history)
             print(chr(27) + "[2J") # Clear terminal
             print(f"Chat history:\n\033[92m{messages}\033[0m\n")
             continue
         if query:
-            result = rag_chain.invoke({"input": query, "chat_history": chat_history})
-
-            print(result['answer'])
-
+            # Print the answer as it's generated
+            answer_parts: list[str] = []
+            for chunk in rag_chain.stream({"input": query, "chat_history": chat_history}):
+                answer_part = chunk.get("answer", "")
+                sys.stdout.write(answer_part)
+                sys.stdout.flush()
+                answer_parts.append(answer_part)
+            print()
+
+            answer = "".join(answer_parts)
             chat_history.append(HumanMessage(content=query))
-            chat_history.append(AIMessage(content=result["answer"]))
-
-
-def get_llm():
-    return Ollama(model=OLLAMA_MODEL)
+            chat_history.append(AIMessage(content=answer))
 
 
 if __name__ == "__main__":
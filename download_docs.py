@@ -1,17 +1,23 @@
+import asyncio
 from datetime import datetime
 import os
+import selectors
 import signal
 import sys
 import threading
 from typing import Optional, Any
-import requests
-import json
+import httpx
+from blake3 import blake3
+import orjson
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed, Future
 
-from env import CONFIG_PATH, DOCUMENTS_PATH
+from env import CONFIG_PATH, DOCSTORE_PATH, DOCUMENTS_PATH, ETAGS_TABLE_NAME
+from utils import get_sqlitestore, set_file_hash
+from utils.get_sqlitestore import Sqlitestore
 
 MAX_WORKERS: int = 5
+CHUNK_SIZE: int = 65536
+EXIT_POLL_INTERVAL: float = 0.2
 
 # Global flag to signal thread termination
 exit_flag: threading.Event = threading.Event()
@@ -34,13 +40,51 @@ def signal_handler(signum: int, frame: Any) -> None:
 def check_for_exit() -> None:
     """
     Continuously check for user input to exit the program.
+
+    Stdin is polled with a short timeout rather than blocking on input(), so the exit flag is noticed
+    and the thread stops promptly when the downloads are stopped in another way.
+    Where stdin can't be polled (e.g. on Windows, where select() only accepts sockets), it falls back to input().
     """
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(sys.stdin, selectors.EVENT_READ)
+            while not exit_flag.is_set():
+                if not selector.select(timeout=EXIT_POLL_INTERVAL):
+                    continue
+
+                line: str = sys.stdin.readline()
+                if not line or is_exit_input(line):
+                    break  # stdin was closed or the user exited
+            return
+    except (OSError, ValueError):
+        pass
+
     while not exit_flag.is_set():
-        if input() == "q":
-            with print_lock:
-                print("Exiting...")
-            exit_flag.set()
+        try:
+            line = input()
+        except EOFError:
             break
+        if is_exit_input(line):
+            break
+
+def is_exit_input(line: str) -> bool:
+    """
+    Check if a line of user input asks to exit the program, and set the exit flag if it does.
+
+    Args:
+        line (str): The line of user input.
+
+    Returns:
+        bool: True if the user asked to exit, otherwise False.
+    """
+    if line.strip() != "q":
+        return False
+
+    with print_lock:
+        print("Exiting...")
+    exit_flag.set()
+
+    return True
 
 def load_json_file(file_path: str) -> Optional[dict[str, Any]]:
     """
@@ -53,50 +97,88 @@ def load_json_file(file_path: str) -> Optional[dict[str, Any]]:
         Optional[dict[str, Any]]: Parsed JSON data as a dictionary, or None if an error occurs.
     """
     try:
-        with open(file_path, "r") as file:
-            return json.load(file)
+        with open(file_path, "rb") as file:
+            return orjson.loads(file.read())
     except FileNotFoundError:
         with print_lock:
             print(f"Error: The file '{file_path}' was not found.")
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         with print_lock:
             print(f"Error: The file '{file_path}' contains invalid JSON.")
             print(f"JSON decode error: {str(e)}")
     return None
 
-def download_file(url: str, file_path: str, desc: str) -> None:
+def get_etags_store() -> Sqlitestore:
+    """
+    Retrieve the SQLite store for the ETags of downloaded files.
+
+    Returns:
+        Sqlitestore: SQLite store instance mapping URLs to the ETag of the last download.
+    """
+    return get_sqlitestore(DOCSTORE_PATH, ETAGS_TABLE_NAME)
+
+async def download_file(
+    client: httpx.AsyncClient,
+    url: str,
+    file_path: str,
+    desc: str,
+    etag: Optional[str] = None
+) -> tuple[Optional[str], Optional[str]]:
     """
     Download a file from a given URL and save it to the specified path.
 
+    The file is hashed while it is downloaded, so it doesn't have to be read back from disk to be hashed.
+    It is downloaded to a `.part` file, which only replaces the file once it is complete.
+    If an ETag is given, the request is conditional and nothing is downloaded if the remote file still has that ETag.
+
     Args:
+        client (httpx.AsyncClient): HTTP client shared by all downloads.
         url (str): URL of the file to download.
         file_path (str): Path where the file will be saved.
         desc (str): Description for the progress bar.
+        etag (Optional[str], default None): ETag of the local copy of the file.
+
+    Returns:
+        tuple[Optional[str], Optional[str]]: The BLAKE3 hash of the file (None if the file was not modified or the download was cancelled) and the ETag of the remote file.
     """
-    with requests.get(url, stream=True) as r:
+    file_hash = blake3()
+    headers: dict[str, str] = {"If-None-Match": etag} if etag else {}
+    async with client.stream("GET", url, headers=headers) as r:
+        if r.status_code == httpx.codes.NOT_MODIFIED:
+            return None, etag
+
         total_size_in_bytes: int = int(r.headers.get("Content-Length", 0))
-        with open(file_path, "wb") as f, tqdm(
-            desc=desc,
-            total=total_size_in_bytes,
-            unit="B",
-            unit_scale=True,
-            unit_divisor=1024,
-            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{rate_fmt}]",
-            leave=False
-        ) as progress_bar:
-            for data in r.iter_content(chunk_size=8192):
-                if exit_flag.is_set():
-                    f.close()
-                    os.remove(file_path)  # Remove partially downloaded file
-                    return
-                size: int = f.write(data)
-                progress_bar.update(size)
+        part_path = file_path + ".part"
+        try:
+            with open(part_path, "wb") as f, tqdm(
+                desc=desc,
+                total=total_size_in_bytes,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{rate_fmt}]",
+                leave=False
+            ) as progress_bar:
+                async for data in r.aiter_bytes(chunk_size=CHUNK_SIZE):
+                    if exit_flag.is_set():
+                        return None, None
+                    file_hash.update(data)
+                    size: int = f.write(data)
+                    progress_bar.update(size)
+            os.replace(part_path, file_path)
+        finally:
+            # Remove the partially downloaded file if the download was cancelled or failed, leaving any previous copy untouched
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    return file_hash.hexdigest(), r.headers.get("ETag")
 
-def is_remote_file_updated(file_path: str, url: str) -> bool:
+async def is_remote_file_updated(client: httpx.AsyncClient, file_path: str, url: str) -> bool:
     """
     Check if the remote file has been updated compared to the local file.
 
     Args:
+        client (httpx.AsyncClient): HTTP client shared by all downloads.
         file_path (str): Path to the local file.
         url (str): URL of the remote file.
 
@@ -109,7 +191,7 @@ def is_remote_file_updated(file_path: str, url: str) -> bool:
     local_mtime: float = os.path.getmtime(file_path)
     local_file_last_modified_date: datetime = datetime.fromtimestamp(local_mtime)
 
-    response: requests.Response = requests.head(url, allow_redirects=True)
+    response: httpx.Response = await client.head(url)
     last_modified: Optional[str] = response.headers.get("Last-Modified")
     size: Optional[str] = response.headers.get("Content-Length")
 
@@ -126,50 +208,64 @@ def is_remote_file_updated(file_path: str, url: str) -> bool:
 
     return False
 
-def download_single_pdf(pdf: dict[str, str], download_path: str, desc: str) -> None:
+async def download_single_pdf(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    pdf: dict[str, str],
+    download_path: str,
+    desc: str
+) -> None:
     """
     Download a single PDF file if it needs updating.
 
+    If the ETag of the local copy is known, a conditional request decides whether the file has changed.
+    Otherwise the Last-Modified and Content-Length headers are compared with the local copy.
+
     Args:
+        client (httpx.AsyncClient): HTTP client shared by all downloads.
+        semaphore (asyncio.Semaphore): Semaphore limiting the number of parallel downloads.
         pdf (dict[str, str]): Dictionary containing 'url' and 'filename' of the PDF.
         download_path (str): Path where the PDF will be saved.
         desc (str): Description for the progress bar.
     """
-    if exit_flag.is_set():
-        return
-
-    url: str = pdf["url"]
-    filename: str = pdf["filename"]
-    file_path: str = os.path.join(download_path, filename)
-
-    if is_remote_file_updated(file_path, url):
-        download_file(url, file_path, desc)
-
-def download_docs(config: dict[str, list[dict[str, Any]]], download_path: str) -> None:
+    async with semaphore:
+        if exit_flag.is_set():
+            return
+
+        url: str = pdf["url"]
+        filename: str = pdf["filename"]
+        file_path: str = os.path.join(download_path, filename)
+
+        etags_store: Sqlitestore = get_etags_store()
+        stored_etags: list[Optional[str]] = etags_store.mget([url])
+        etag: Optional[str] = stored_etags[0] if stored_etags and os.path.exists(file_path) else None
+
+        if etag or await is_remote_file_updated(client, file_path, url):
+            file_hash, etag = await download_file(client, url, file_path, desc, etag)
+            if file_hash:
+                set_file_hash(file_path, file_hash)
+                if etag:
+                    etags_store.mset([(url, etag)])
+                else:
+                    etags_store.mdelete([url])
+
+async def download_pdfs(config: dict[str, list[dict[str, Any]]], download_path: str, max_name_length: int) -> None:
     """
-    Download multiple documents based on the provided configuration.
+    Download all PDFs in the configuration concurrently.
+
+    All downloads share one HTTP/2 client, so requests to the same host are multiplexed over a pooled
+    connection instead of each paying for its own TCP and TLS handshake.
 
     Args:
         config (dict[str, list[dict[str, Any]]]): Configuration dictionary containing document information.
         download_path (str): Path where the documents will be saved.
+        max_name_length (int): Length to pad the document names in the progress bars to.
     """
-    exit_thread: threading.Thread = threading.Thread(target=check_for_exit)
-    exit_thread.daemon = True
-    exit_thread.start()
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(MAX_WORKERS)
+    limits: httpx.Limits = httpx.Limits(max_connections=MAX_WORKERS, max_keepalive_connections=MAX_WORKERS)
 
-    with print_lock:
-        print(f"Queuing up to {MAX_WORKERS} downloads in parallel. Press q and then ENTER to cancel\n")
-
-    max_name_length: int = max(len(doc["name"]) for doc in config["documents"])
-
-    with print_lock:
-        print("Following documents are downloaded:")
-        for doc in config["documents"]:
-            desc: str = f"{doc['name']:<{max_name_length}}"
-            print(f" - {desc}\t{len(doc['pdfs'])} document{'s' if len(doc['pdfs']) != 1 else ''}")
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures: list[Future] = []
+    async with httpx.AsyncClient(http2=True, follow_redirects=True, limits=limits, timeout=None) as client:
+        tasks: list[asyncio.Task] = []
         for doc in config["documents"]:
             if exit_flag.is_set():
                 break
@@ -177,16 +273,15 @@ def download_docs(config: dict[str, list[dict[str, Any]]], download_path: str) -
             for pdf in doc["pdfs"]:
                 if exit_flag.is_set():
                     break
-                future: Future = executor.submit(download_single_pdf, pdf, download_path, desc)
-                futures.append(future)
+                tasks.append(asyncio.create_task(download_single_pdf(client, semaphore, pdf, download_path, desc)))
 
-        total_downloads: int = len(futures)
+        total_downloads: int = len(tasks)
         with tqdm(total=total_downloads, desc="Total", unit="file", unit_scale=True, bar_format="{l_bar}{bar}| {n}/{total} [{rate_fmt}]") as overall_progress:
-            for future in as_completed(futures):
+            for task in asyncio.as_completed(tasks):
                 if exit_flag.is_set():
                     break
                 try:
-                    future.result()
+                    await task
                 except Exception as e:
                     with print_lock:
                         print(f"An error occurred: {str(e)}")
@@ -195,14 +290,41 @@ def download_docs(config: dict[str, list[dict[str, Any]]], download_path: str) -
         if exit_flag.is_set():
             with print_lock:
                 print("\nCancelling all ongoing downloads...")
-            for future in futures:
-                future.cancel()
-            executor.shutdown(wait=False)
-            with print_lock:
-                print("\nAll downloads stopped.\n")
-        else:
-            with print_lock:
-                print("\nDocuments are now available")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+def download_docs(config: dict[str, list[dict[str, Any]]], download_path: str) -> None:
+    """
+    Download multiple documents based on the provided configuration.
+
+    Args:
+        config (dict[str, list[dict[str, Any]]]): Configuration dictionary containing document information.
+        download_path (str): Path where the documents will be saved.
+    """
+    exit_thread: threading.Thread = threading.Thread(target=check_for_exit)
+    exit_thread.daemon = True
+    exit_thread.start()
+
+    with print_lock:
+        print(f"Queuing up to {MAX_WORKERS} downloads in parallel. Press q and then ENTER to cancel\n")
+
+    max_name_length: int = max(len(doc["name"]) for doc in config["documents"])
+
+    with print_lock:
+        print("Following documents are downloaded:")
+        for doc in config["documents"]:
+            desc: str = f"{doc['name']:<{max_name_length}}"
+            print(f" - {desc}\t{len(doc['pdfs'])} document{'s' if len(doc['pdfs']) != 1 else ''}")
+
+    asyncio.run(download_pdfs(config, download_path, max_name_length))
+
+    if exit_flag.is_set():
+        with print_lock:
+            print("\nAll downloads stopped.\n")
+    else:
+        with print_lock:
+            print("\nDocuments are now available")
 
 def main(file_path: str, download_path: str) -> None:
     """
@@ -229,7 +351,6 @@ def main(file_path: str, download_path: str) -> None:
                 print("\nKeyboard interrupt received, exiting...")
         finally:
             exit_flag.set()
-            threading.Event().wait(1)
             sys.exit(0)
     else:
         with print_lock:
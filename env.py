@@ -1,11 +1,26 @@
 OLLAMA_MODEL = "llama3.1"
+OLLAMA_NUM_CTX = 8192
+OLLAMA_NUM_PREDICT = 1024
 OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+LLM_CACHE_PATH = ".langchain.db"
+EMBEDDING_CACHE_PATH = ".embcache"
 VERBOSE = False
 CHROMA_PATH = "chroma"
 CHROMA_COLLECTION_NAME = "chunks"
+QUANTIZED_INDEX_PATH = "quantized_index"
+RESCORE_MULTIPLIER = 4
+HAMMING_CANDIDATE_FRACTION = 0.25
 DOCSTORE_PATH = "docstore"
 DOCSTORE_TABLE_NAME = "documents"
+EXISTING_IDS_FILTER_PATH = "existing_ids.bloom"
+EXISTING_IDS_FILTER_CAPACITY = 1_000_000
 DOCUMENT_HASHES_TABLE_NAME = "documenthashes"
+FILE_HASHES_TABLE_NAME = "filehashes"
+ETAGS_TABLE_NAME = "etags"
+SEMANTIC_CACHE_TABLE_NAME = "semanticcache"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL = 7 * 24 * 60 * 60  # Seconds
+SEMANTIC_CACHE_VERSION = 1  # Bump when the query_rag prompts or pipeline change
 PARENT_DOC_ID = "doc_id"
 PARENT_CHUNK_SIZE = 3000
 CHILD_CHUNK_SIZE = 400
@@ -1,14 +1,19 @@
 import argparse
-import hashlib
+import multiprocessing
 import os
 import shutil
-from typing import Optional
-from env import CHROMA_PATH, DOCSTORE_PATH, DOCSTORE_TABLE_NAME, DOCUMENT_HASHES_TABLE_NAME, DOCUMENTS_PATH, PARENT_CHUNK_SIZE, PARENT_DOC_ID, CHILD_CHUNK_SIZE
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import groupby, islice
+from typing import Iterator, Optional, Union
+from xxhash import xxh3_128_hexdigest
+from env import CHROMA_PATH, DOCSTORE_PATH, EXISTING_IDS_FILTER_CAPACITY, EXISTING_IDS_FILTER_PATH, QUANTIZED_INDEX_PATH, DOCSTORE_TABLE_NAME, DOCUMENT_HASHES_TABLE_NAME, DOCUMENTS_PATH, PARENT_CHUNK_SIZE, PARENT_DOC_ID, CHILD_CHUNK_SIZE
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from langchain_chroma.vectorstores import VectorStore
-from utils import get_sqlitestore, get_vectorstore, verbose_print
+from utils import BloomFilter, get_file_hash, get_quantized_index, get_semantic_cache, get_sqlitestore, get_vectorstore, update_quantized_index, verbose_print
+
+PARENT_IDX_KEY = "_parent_idx"
 
 def main(path: str) -> None:
     """
@@ -22,32 +27,89 @@ def main(path: str) -> None:
         print("✨ Clearing Database")
         clear_database()
 
-    # Load, split, and add documents to the database
-    for root, _, files in os.walk(path):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                file_path = os.path.join(root, file)
+    documents_added = False
+    existing_ids = load_existing_ids()
+    verbose_print(f"\tNumber of existing documents in DB: {len(existing_ids)}")
+
+    # Find the documents that are new or have changed
+    file_hashes = {}
+    for file_path in find_pdf_files(path):
+        local_file_hash = get_file_hash(file_path)
+        document_hash = get_document_hash_from_store(file_path)
+
+        if local_file_hash == document_hash:
+            print(f"Skipping {file_path} because it already exists in the database")
+            continue
+        elif not document_hash:
+            print(f"{file_path} does not exist in the database")
+        else:
+            print(f"{file_path} exists in the database but an older version.")
+
+        file_hashes[file_path] = local_file_hash
+
+    # Load and split the documents in parallel, and add them to the database one at a time
+    try:
+        for file_path, docs, sub_docs in process_pdfs(list(file_hashes)):
+            print(f"Adding {file_path} and chunks to Chroma and doc store...")
+            add_documents_to_store(docs, sub_docs, existing_ids=existing_ids)
+
+            add_document_hash(file_path, file_hashes[file_path])
+            documents_added = True
+    finally:
+        existing_ids.save(EXISTING_IDS_FILTER_PATH)
+
+        # Also runs if a later file fails, as the documents added before it are already marked as stored
+        if documents_added:
+            print("Updating quantized index...")
+            update_quantized_index()
 
-                local_file_hash = get_file_hash(file_path)
-                document_hash = get_document_hash_from_store(file_path)
+            # Cached responses may be outdated by the new documents
+            get_semantic_cache().clear()
 
-                if local_file_hash == document_hash:
-                    print(f"Skipping {file_path} because it already exists in the database")
-                    continue
-                elif not document_hash:
-                    print(f"{file_path} does not exist in the database")
-                else:
-                    print(f"{file_path} exists in the database but an older version.")
+def find_pdf_files(path: str) -> Iterator[str]:
+    """
+    Recursively find all PDF files in a directory.
+
+    Uses os.scandir, whose directory entries already know their type on most platforms,
+    so no extra stat call is needed per entry. Like os.walk, directories that are missing
+    or can't be read are skipped.
+
+    Args:
+        path (str): The root directory to search.
 
-                documents = load_documents(file_path)
+    Yields:
+        str: Path of each PDF file.
+    """
+    subdirectories = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name[-4:].lower() == ".pdf" and entry.is_file():
+                    yield entry.path
+    except OSError:
+        return
+
+    for subdirectory in subdirectories:
+        yield from find_pdf_files(subdirectory)
+
+def load_existing_ids() -> BloomFilter:
+    """
+    Load the Bloom filter of the document IDs in the vectorstore.
 
-                print("Splitting document into chunks...")
-                docs, sub_docs = split_documents(documents, parent_chunk_size=PARENT_CHUNK_SIZE, child_chunk_size=CHILD_CHUNK_SIZE)
+    The filter is built from the vectorstore the first time, and saved by main after adding documents.
 
-                print("Adding document and chunks to Chroma and doc store...")
-                add_documents_to_store(docs, sub_docs)
+    Returns:
+        BloomFilter: Bloom filter containing the IDs of all documents in the vectorstore.
+    """
+    if os.path.exists(EXISTING_IDS_FILTER_PATH):
+        return BloomFilter.load(EXISTING_IDS_FILTER_PATH)
 
-                add_document_hash(file_path)
+    existing_ids = BloomFilter(EXISTING_IDS_FILTER_CAPACITY)
+    existing_ids.update(get_vectorstore().get(include=[])["ids"])
+
+    return existing_ids
 
 def get_document_hashes_store():
     """
@@ -59,16 +121,17 @@ def get_document_hashes_store():
     store = get_sqlitestore(DOCSTORE_PATH, DOCUMENT_HASHES_TABLE_NAME)
     return store
 
-def add_document_hash(file_path: str) -> None:
+def add_document_hash(file_path: str, file_hash: str) -> None:
     """
     Add a document hash to the database.
 
     Args:
-        file_path (str): The file path of the document to hash and store.
+        file_path (str): The file path of the document.
+        file_hash (str): The hash of the document, as returned by get_file_hash.
     """
     store = get_document_hashes_store()
     store.mset([
-        (file_path, get_file_hash(file_path))
+        (file_path, file_hash)
     ])
 
 def get_document_hash_from_store(file_path: str) -> Optional[str]:
@@ -88,34 +151,62 @@ def get_document_hash_from_store(file_path: str) -> Optional[str]:
 
     return None
 
-def get_file_hash(file_path: str) -> str:
+def parse_arguments() -> None:
     """
-    Calculate the SHA-1 hash of a file.
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    return parser.parse_args()
+
+def process_pdf(file_path: str) -> tuple[list[Document], list[Document]]:
+    """
+    Load a PDF file and split it into chunks and sub-chunks.
 
     Args:
-        file_path (str): Path to the file to hash.
+        file_path (str): Path to the PDF file.
 
     Returns:
-        str: The SHA-1 hash of the file.
+        tuple[list[Document], list[Document]]: Tuple containing lists of parent and sub-documents.
     """
-    sha1 = hashlib.sha1()
-    buffer_size = 65536
-    with open(file_path, 'rb') as file:
-        while chunk := file.read(buffer_size):
-            sha1.update(chunk)
+    documents = load_documents(file_path)
 
-    return sha1.hexdigest()
+    return split_documents(documents, parent_chunk_size=PARENT_CHUNK_SIZE, child_chunk_size=CHILD_CHUNK_SIZE)
 
-def parse_arguments() -> None:
+def process_pdfs(file_paths: list[str], max_workers: Optional[int] = None) -> Iterator[tuple[str, list[Document], list[Document]]]:
     """
-    Parse command-line arguments.
+    Load and split PDF files in worker processes.
 
-    Returns:
-        argparse.Namespace: Parsed command-line arguments.
+    Parsing and splitting is CPU-bound Python code, so it runs in a process pool to use all cores.
+    At most twice as many files as there are workers are processed ahead of the caller, so parsed documents
+    don't pile up in memory while the caller is adding them to the database.
+
+    Args:
+        file_paths (list[str]): Paths to the PDF files.
+        max_workers (Optional[int], default None): Number of worker processes. Defaults to the number of CPUs.
+
+    Yields:
+        tuple[str, list[Document], list[Document]]: The file path and its parent and sub-documents, in the order they finish.
     """
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--reset", action="store_true", help="Reset the database.")
-    return parser.parse_args()
+    max_workers = max_workers or os.cpu_count() or 1
+    remaining_file_paths = iter(file_paths)
+
+    # Workers are spawned rather than forked, as a forked worker would inherit the open SQLite and Chroma connections of the caller
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending: dict[Future, str] = {}
+        while True:
+            for file_path in islice(remaining_file_paths, max_workers * 2 - len(pending)):
+                pending[executor.submit(process_pdf, file_path)] = file_path
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield (pending.pop(future), *future.result())
 
 def load_documents(path: str) -> list[Document]:
     """
@@ -156,19 +247,23 @@ def split_documents(
     new_documents = generate_documents_with_metadata(parent_text_splitter.split_documents(documents))
     sub_documents = []
 
-    child_text_splitter = None
     if child_chunk_size > 0:
         child_text_splitter = RecursiveCharacterTextSplitter(chunk_size=child_chunk_size)
 
-    for idx, document in enumerate(new_documents):
-        if child_text_splitter:
-            _sub_documents = generate_documents_with_metadata(
-                child_text_splitter.split_documents([document]),
-                idx
-            )
+        # Split all parents in one call. The splitter copies the metadata to the sub-documents,
+        # so the parent index tells which parent each sub-document came from.
+        for idx, document in enumerate(new_documents):
+            document.metadata[PARENT_IDX_KEY] = idx
 
-            for sub_document in _sub_documents:
-                sub_document.metadata[PARENT_DOC_ID] = document.metadata.get("id")
+        _sub_documents = child_text_splitter.split_documents(new_documents)
+
+        for document in new_documents:
+            del document.metadata[PARENT_IDX_KEY]
+
+        for idx, group in groupby(_sub_documents, key=lambda sub_document: sub_document.metadata[PARENT_IDX_KEY]):
+            for sub_document in generate_documents_with_metadata(list(group), idx):
+                del sub_document.metadata[PARENT_IDX_KEY]
+                sub_document.metadata[PARENT_DOC_ID] = new_documents[idx].metadata.get("id")
                 sub_documents.append(sub_document)
 
     return new_documents, sub_documents
@@ -189,7 +284,8 @@ def chunk_list(lst: list, chunk_size: int) -> list[list]:
 def add_documents_to_store(
         documents: list[Document],
         sub_documents: list[Document] = [],
-        chunk_size: int = 500
+        chunk_size: int = 500,
+        existing_ids: Optional[Union[set[str], BloomFilter]] = None
 ) -> None:
     """
     Add documents to the vectorstore.
@@ -201,6 +297,7 @@ def add_documents_to_store(
         documents (list[Document]): List of documents to add to the bytestore (if sub_documents is empty, then they'll be added to the vectorstore).
         sub_documents (list[Document], optional): List of sub-documents to add to the vectorstore. Default is an empty list.
         chunk_size (int, default 500): Number of documents to add in each batch.
+        existing_ids (Optional[Union[set[str], BloomFilter]], default None): IDs already in the vectorstore. Fetched from the vectorstore if None, otherwise updated in place with the added IDs.
     """
     vectorstore = get_vectorstore()
     vectorstore_documents = sub_documents if sub_documents else documents
@@ -209,14 +306,16 @@ def add_documents_to_store(
     if sub_documents:
         docstore.mset(list(zip([doc.metadata["id"] for doc in documents], documents)))
 
-    existing_ids = set(vectorstore.get(include=[])["ids"])
-    verbose_print(f"\tNumber of existing documents in DB: {len(existing_ids)}")
+    if existing_ids is None:
+        existing_ids = set(vectorstore.get(include=[])["ids"])
+        verbose_print(f"\tNumber of existing documents in DB: {len(existing_ids)}")
 
-    new_chunks, updated_chunks = get_documents_to_add_or_update(vectorstore_documents, existing_ids, vectorstore)
+    new_chunks, updated_chunks = get_documents_to_add_or_update(vectorstore_documents, existing_ids, vectorstore, chunk_size)
 
     if new_chunks:
         verbose_print(f"\t👉 Adding new documents: {len(new_chunks)}")
         add_or_update_documents_to_vectorstore(new_chunks, vectorstore, chunk_size)
+        existing_ids.update(chunk.metadata["id"] for chunk in new_chunks)
     else:
         verbose_print("\t✅ No new documents to add")
 
@@ -228,8 +327,9 @@ def add_documents_to_store(
 
 def get_documents_to_add_or_update(
         documents: list[Document],
-        existing_ids: list[str],
-        vectorstore: VectorStore
+        existing_ids: Union[set[str], BloomFilter],
+        vectorstore: VectorStore,
+        chunk_size: int = 500
 ) -> tuple[list[Document], list[Document]]:
     """
     Get documents that need to be added or updated.
@@ -237,27 +337,39 @@ def get_documents_to_add_or_update(
     A document is added if its ID is not present in the vectorstore. A document is updated if the hash is different.
     Documents that are already present and have the same hash are ignored.
 
+    The hashes of the present documents are fetched from the vectorstore in batches rather than one document at a time.
+    Only documents in existing_ids are looked up, so existing_ids may contain false positives (e.g. a Bloom filter),
+    but must contain every document ID in the vectorstore.
+
     Args:
         documents (list[Document]): List of documents with IDs.
-        existing_ids (list[str]): List of existing document IDs in the vectorstore.
+        existing_ids (Union[set[str], BloomFilter]): Existing document IDs in the vectorstore.
         vectorstore (VectorStore): Vectorstore instance.
+        chunk_size (int, default 500): Number of documents to look up in each batch.
 
     Returns:
         tuple[list[Document], list[Document]]: Tuple containing lists of new and updated documents.
     """
     new_documents = []
-    updated_documents = []
-
+    present_documents = []
     for document in documents:
-        id = document.metadata["id"]
-        hash = document.metadata["hash"]
+        if document.metadata["id"] in existing_ids:
+            present_documents.append(document)
+        else:
+            new_documents.append(document)
+
+    hash_by_id = {}
+    for chunk_group in chunk_list(present_documents, chunk_size):
+        rows = vectorstore.get(ids=[document.metadata["id"] for document in chunk_group], include=["metadatas"])
+        hash_by_id.update(zip(rows["ids"], (metadata.get("hash") for metadata in rows["metadatas"])))
 
-        if id not in existing_ids:
+    updated_documents = []
+    for document in present_documents:
+        id = document.metadata["id"]
+        if id not in hash_by_id:
             new_documents.append(document)
-        else:
-            existing_doc = vectorstore.get(ids=[id])
-            if existing_doc and existing_doc["metadatas"][0].get("hash") != hash:
-                updated_documents.append(document)
+        elif hash_by_id[id] != document.metadata["hash"]:
+            updated_documents.append(document)
 
     return new_documents, updated_documents
 
@@ -278,17 +390,21 @@ def add_or_update_documents_to_vectorstore(
         vectorstore.add_documents(chunk_group, ids=[chunk.metadata["id"] for chunk in chunk_group])
         verbose_print(f"\t👉 Added: {chunk_size * idx + len(chunk_group)}")
 
-def generate_hash(text: str) -> str:
+def generate_hashes(texts: list[str]) -> list[str]:
     """
-    Generate a SHA-256 hash for the given text.
+    Generate a 128-bit XXH3 hash for each of the given texts.
+
+    The hashes are only used to detect changed chunks, so a fast non-cryptographic hash is used.
+    It has almost no per-call overhead, which dominates for short texts like chunks.
 
     Args:
-        text (str): Text to generate hash for.
+        texts (list[str]): Texts to generate hashes for.
 
     Returns:
-        str: The SHA-256 hash of the text.
+        list[str]: The XXH3 hashes of the texts, in the same order.
     """
-    return hashlib.sha256(text.encode()).hexdigest()
+    hexdigest = xxh3_128_hexdigest
+    return [hexdigest(text.encode()) for text in texts]
 
 def generate_documents_with_metadata(documents: list[Document], source_chunk_idx: Optional[int] = None) -> list[Document]:
     """
@@ -303,8 +419,9 @@ def generate_documents_with_metadata(documents: list[Document], source_chunk_idx
     """
     last_page_id = None
     current_chunk_index = 0
+    hashes = generate_hashes([document.page_content for document in documents])
 
-    for document in documents:
+    for document, hash in zip(documents, hashes):
         source = document.metadata.get("source")
         page = document.metadata.get("page")
         current_page_id = f"{source}"
@@ -320,21 +437,32 @@ def generate_documents_with_metadata(documents: list[Document], source_chunk_idx
 
         id = f"{current_page_id}:{current_chunk_index}"
         document.metadata["id"] = id
-        document.metadata["hash"] = generate_hash(document.page_content)
+        document.metadata["hash"] = hash
         last_page_id = current_page_id
 
     return documents
 
 def clear_database() -> None:
     """
-    Clear both the Chroma and docstore databases.
+    Clear the Chroma and docstore databases, the quantized index and the existing IDs filter.
 
     This removes all data from the specified database paths.
     """
     if os.path.exists(CHROMA_PATH):
         shutil.rmtree(CHROMA_PATH)
-    if os.path.exists(DOCSTORE_PATH):
-        os.remove(DOCSTORE_PATH)
+    for docstore_file in (DOCSTORE_PATH, f"{DOCSTORE_PATH}-wal", f"{DOCSTORE_PATH}-shm"):
+        if os.path.exists(docstore_file):
+            os.remove(docstore_file)
+    if os.path.exists(QUANTIZED_INDEX_PATH):
+        shutil.rmtree(QUANTIZED_INDEX_PATH)
+    if os.path.exists(EXISTING_IDS_FILTER_PATH):
+        os.remove(EXISTING_IDS_FILTER_PATH)
+
+    # Drop handles to the removed databases so they are reopened on next use
+    get_vectorstore.cache_clear()
+    get_sqlitestore.cache_clear()
+    get_quantized_index.cache_clear()
+    get_semantic_cache.cache_clear()
 
 if __name__ == "__main__":
     main(DOCUMENTS_PATH)
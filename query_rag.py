@@ -1,17 +1,76 @@
 import argparse
+import asyncio
 import os
-from typing import Optional
+import re
+import sys
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+import numpy as np
 from langchain.retrievers.multi_query import LineListOutputParser
-from env import CONFIG_PATH, DOCSTORE_PATH, DOCSTORE_TABLE_NAME, DOCUMENTS_PATH, INCLUDE_SOURCES, OLLAMA_MODEL, PARENT_DOC_ID
-from utils import get_sqlitestore, load_json_file, verbose_print
+from env import CONFIG_PATH, DOCSTORE_PATH, DOCSTORE_TABLE_NAME, DOCUMENTS_PATH, INCLUDE_SOURCES, PARENT_DOC_ID
+from utils import get_llm, get_semantic_cache, get_sqlitestore, load_json_file, verbose_print
+from utils.get_quantized_index import normalize
 from utils.get_vectorstore import get_vectorstore
 from langchain_core.prompts import PromptTemplate
-from langchain_community.llms.ollama import Ollama
 from langchain.chains.query_constructor.base import AttributeInfo
 from langchain.retrievers.multi_vector import MultiVectorRetriever
-from langchain_core.retrievers import BaseRetriever
 from langchain_core.documents import Document
 
+QUERY_PROMPT = PromptTemplate(
+    template="""You are an AI language model assistant. Your task is to generate five
+    different versions of the given user question to retrieve relevant documents from a vector
+    database. By generating multiple perspectives on the user question, your goal is to help
+    the user overcome some of the limitations of the distance-based similarity search.
+    Provide these and only these alternative questions separated by newlines.
+    Original question: {question}""",
+    input_variables=["question"]
+)
+
+KEYWORDS_PROMPT = PromptTemplate(
+    template="""You are an AI language model assistant. Your task is to identify related keywords for the provided user question.
+
+    Keywords:
+    {keywords}
+
+    ---------
+
+    Your goal is to find related keywords that will help improve the results of distance-based similarity searches. Provide only the related keywords in a single list, each on a new line.
+
+    Question:
+    {question}""",
+    input_variables=["keywords", "question"]
+)
+
+ANSWER_PROMPT = PromptTemplate(
+    template="""Answer the question based only on the following context:
+
+    {context}
+
+    ---
+
+    Answer the question based on the above context: {question}""",
+    input_variables=["context", "question"]
+)
+
+# A non-empty line without surrounding whitespace and without a leading "-", "*" or "1." list marker
+LINE_PATTERN = re.compile(r"^[^\S\n]*(?:(?:[-*]|\d+[.)])[^\S\n]+)?(.*?\S)[^\S\n]*$", re.MULTILINE)
+
+class StrippedLineListOutputParser(LineListOutputParser):
+    """
+    Output parser for a list of lines, finding all lines in one pass with a precompiled pattern.
+
+    Unlike LineListOutputParser, list markers are removed so keywords can be matched against the configuration.
+    """
+    def parse(self, text: str) -> list[str]:
+        return LINE_PATTERN.findall(text)
+
+QUERY_CHAIN = QUERY_PROMPT | get_llm() | StrippedLineListOutputParser()
+KEYWORDS_CHAIN = KEYWORDS_PROMPT | get_llm() | StrippedLineListOutputParser()
+ANSWER_CHAIN = ANSWER_PROMPT | get_llm()
+
+# Runs every query on the same event loop, as the LLM's async HTTP client is bound to the loop it was first used on
+RUNNER = asyncio.Runner()
+
 def main() -> None:
     """
     Main function to handle command-line arguments and interactive querying.
@@ -47,19 +106,6 @@ def interactive_query_loop() -> None:
             query_rag(query)
 
 
-def get_prompt(template: str, input_variables: list[str]) -> PromptTemplate:
-    """
-    Creates a PromptTemplate with a given template and input variables.
-
-    Args:
-        template (str): The template string used to structure the prompt.
-        input_variables (list[str]): List of variable names used in the template.
-
-    Returns:
-        PromptTemplate: A configured PromptTemplate object.
-    """
-    return PromptTemplate(template=template, input_variables=input_variables)
-
 def get_metadata_field_info() -> list[AttributeInfo]:
     """
     Returns metadata field information for document retrieval.
@@ -82,7 +128,7 @@ def get_metadata_field_info() -> list[AttributeInfo]:
         ),
         AttributeInfo(
             name="hash",
-            description="SHA1 Hash of the document chunks",
+            description="Hash of the document chunks",
             type="string",
         ),
         AttributeInfo(
@@ -92,21 +138,18 @@ def get_metadata_field_info() -> list[AttributeInfo]:
         )
     ]
 
-def get_keywords_from_config() -> list[str]:
+@lru_cache(maxsize=None)
+def get_keywords_from_config() -> tuple[str, ...]:
     """
-    Extracts a list of keywords from the configuration file.
+    Extracts the keywords from the configuration file.
+
+    The keywords are the keys of the keyword index, so they are unique and keep the order of the configuration file.
+    This keeps the keywords prompt identical between runs.
 
     Returns:
-        list[str]: A list of unique keywords found in the configuration file.
-        None: If the configuration file or keyword entries are missing.
+        tuple[str, ...]: The unique keywords found in the configuration file.
     """
-    config: Optional[dict[str, dict]] = load_json_file(CONFIG_PATH)
-    if not config or not config['documents']:
-        return None
-
-    result: list[str] = list(set(keyword for value in config['documents'] for keyword in value['keywords']))
-
-    return result
+    return tuple(get_keyword_index_from_config())
 
 def get_filenames_based_on_keywords_from_config(keywords: list[str]) -> list[str]:
     """
@@ -117,18 +160,36 @@ def get_filenames_based_on_keywords_from_config(keywords: list[str]) -> list[str
 
     Returns:
         list[str]: List of filenames that match the provided keywords.
-        None: If no matching documents are found or the configuration is missing.
     """
-    config: Optional[dict[str, dict]] = load_json_file(CONFIG_PATH)
-    if not config or not config['documents']:
-        return None
+    keyword_index = get_keyword_index_from_config()
+    result = list(dict.fromkeys(filename for keyword in keywords for filename in keyword_index.get(keyword, ())))
 
-    documents = [document for document in config['documents'] if any(keyword in document['keywords'] for keyword in keywords)]
-    result = [os.path.join(DOCUMENTS_PATH, pdf['filename']) for document in documents for pdf in document['pdfs']]
+    return result
+
+@lru_cache(maxsize=None)
+def get_keyword_index_from_config() -> dict[str, list[str]]:
+    """
+    Builds an index from each keyword in the configuration file to the filenames of the documents it appears on.
+
+    The index is built once per process, so looking up the filenames of a keyword does not scan all documents.
+
+    Returns:
+        dict[str, list[str]]: Filenames of the documents for each keyword.
+
+    Raises:
+        ConfigError: If the configuration file is missing or invalid.
+    """
+    config: dict[str, dict] = load_json_file(CONFIG_PATH)
+
+    result: dict[str, list[str]] = {}
+    for document in config['documents']:
+        filenames = [os.path.join(DOCUMENTS_PATH, pdf['filename']) for pdf in document['pdfs']]
+        for keyword in document['keywords']:
+            result.setdefault(keyword, []).extend(filenames)
 
     return result
 
-def query_rag(query_text: str) -> str:
+def query_rag(query_text: str, use_cache: bool = True) -> str:
     """
     Handles the query process, from generating alternative queries to retrieving relevant documents and generating a response.
 
@@ -137,125 +198,147 @@ def query_rag(query_text: str) -> str:
 
     Args:
         query_text (str): The text of the user's query.
+        use_cache (bool, default True): Whether to answer from and add the response to the semantic cache.
     """
     try:
-        vectorstore = get_vectorstore()
-        docstore = get_sqlitestore(DOCSTORE_PATH, DOCSTORE_TABLE_NAME)
-        retriever = MultiVectorRetriever(
-            vectorstore=vectorstore,
-            docstore=docstore,
-            id_key=PARENT_DOC_ID,
-        )
+        # Similar queries are answered from the cache without calling the LLM
+        cached = get_semantic_cache().get(query_text) if use_cache else None
+        if cached is not None:
+            verbose_print("Found a cached response to a similar query")
+            response_text, source_pages = cached
+            print(f"Response:\n{response_text}\n")
+        else:
+            response_text, source_pages = RUNNER.run(aquery_rag(query_text))
+            if use_cache:
+                get_semantic_cache().set(query_text, (response_text, source_pages))
 
-        llm = Ollama(model=OLLAMA_MODEL)
-        query_output_parser = LineListOutputParser()
-
-        query_prompt = get_prompt(
-            template="""You are an AI language model assistant. Your task is to generate five
-            different versions of the given user question to retrieve relevant documents from a vector
-            database. By generating multiple perspectives on the user question, your goal is to help
-            the user overcome some of the limitations of the distance-based similarity search.
-            Provide these and only these alternative questions separated by newlines.
-            Original question: {question}""",
-            input_variables=["question"]
-        )
+        if INCLUDE_SOURCES:
+            print(f"Sources:\n{source_pages}\n")
 
-        model = query_prompt | llm | query_output_parser
-        questions = model.invoke({"question": query_text})[1:]
+        return response_text
 
-        verbose_print("\n".join(questions), "\n")
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
-        keywords_prompt = get_prompt(
-            template="""You are an AI language model assistant. Your task is to identify related keywords for the provided user questions.
+@lru_cache(maxsize=None)
+def get_retriever() -> MultiVectorRetriever:
+    """
+    Creates the retriever searching the vectorstore and looking up the parent documents in the docstore.
 
-            Keywords:
-            {keywords}
+    The retriever is built once and reused by every query.
 
-            ---------
+    Returns:
+        MultiVectorRetriever: The retriever.
+    """
+    vectorstore = get_vectorstore()
+    docstore = get_sqlitestore(DOCSTORE_PATH, DOCSTORE_TABLE_NAME)
+    retriever = MultiVectorRetriever(
+        vectorstore=vectorstore,
+        docstore=docstore,
+        id_key=PARENT_DOC_ID,
+    )
 
-            Your goal is to find related keywords that will help improve the results of distance-based similarity searches. Provide only the related keywords in a single list, each on a new line.
+    return retriever
 
-            Questions:
-            {questions}""",
-            input_variables=["keywords", "questions"]
-        )
+async def aquery_rag(query_text: str) -> tuple[str, list[str]]:
+    """
+    Asynchronous implementation of query_rag.
 
-        keywords = " - " + "\n - ".join(get_keywords_from_config())
-        questions_str = " - " + "\n - ".join(questions)
+    The alternative questions and the relevant keywords are both generated from the user's query,
+    so the two LLM calls run concurrently. The response is printed while it is being generated.
 
-        model = keywords_prompt | llm | query_output_parser
-        relevant_keywords = model.invoke({"keywords": keywords, "questions": questions_str})[1:]
-        relevant_sources = get_filenames_based_on_keywords_from_config(relevant_keywords)
+    Args:
+        query_text (str): The text of the user's query.
 
-        relevant_keywords_str = "\n".join(relevant_keywords)
-        verbose_print(f"Relevant keywords:\n{relevant_keywords_str}")
+    Returns:
+        tuple[str, list[str]]: Tuple containing the generated response text and the source page references.
+    """
+    retriever = get_retriever()
 
-        relevant_docs, source_pages = retrieve_relevant_docs(questions, retriever, relevant_sources)
-        response_text = generate_response(query_text, relevant_docs)
+    keywords = " - " + "\n - ".join(get_keywords_from_config())
 
-        print(f"Response:\n{response_text}\n")
+    questions, relevant_keywords = await asyncio.gather(
+        QUERY_CHAIN.ainvoke({"question": query_text}),
+        KEYWORDS_CHAIN.ainvoke({"keywords": keywords, "question": query_text}),
+    )
+    questions = questions[1:]
+    relevant_keywords = relevant_keywords[1:]
 
-        if INCLUDE_SOURCES:
-            print(f"Sources:\n{source_pages}\n")
+    verbose_print("\n".join(questions), "\n")
 
-        return response_text
+    relevant_sources = get_filenames_based_on_keywords_from_config(relevant_keywords)
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    relevant_keywords_str = "\n".join(relevant_keywords)
+    verbose_print(f"Relevant keywords:\n{relevant_keywords_str}")
+
+    relevant_docs, source_pages = retrieve_relevant_docs(questions, retriever, relevant_sources)
+    print("Response:")
+    response_parts = []
+    async for response_part in generate_response(query_text, relevant_docs):
+        sys.stdout.write(response_part)
+        sys.stdout.flush()
+        response_parts.append(response_part)
+    print("\n")
+
+    return "".join(response_parts), source_pages
 
-def retrieve_relevant_docs(questions: list[str], retriever: BaseRetriever, relevant_sources: list[str]) -> tuple[list, list]:
+def retrieve_relevant_docs(questions: list[str], retriever: MultiVectorRetriever, relevant_sources: Optional[list[str]]) -> tuple[list, list]:
     """
     Retrieves relevant documents based on generated questions and relevant sources.
 
+    The alternative questions are close in meaning, so instead of searching for each of them, their embeddings
+    are averaged and a single search returns as many sub-documents as the separate searches would.
+
     Args:
         questions (list[str]): List of alternative questions generated from the original query.
-        retriever (BaseRetriever): The retriever instance used to find relevant documents.
-        relevant_sources (list[str]): List of source file paths to narrow down the search.
+        retriever (MultiVectorRetriever): The retriever whose vectorstore and docstore are searched.
+        relevant_sources (Optional[list[str]]): List of source file paths to narrow down the search.
 
     Returns:
         tuple[list, list]: A tuple containing a list of relevant documents and a list of source page references.
     """
-    relevant_docs = []
-    source_ids = set()
-    source_pages = []
-
-    for search in questions:
-        _relevant_docs = [
-            doc for doc in retriever.invoke(search, where={"source": {"$in": relevant_sources}}) if doc.metadata.get("id") not in source_ids
-        ]
-        relevant_docs.extend(_relevant_docs)
-        source_ids.update(doc.metadata.get("id") for doc in _relevant_docs)
-        source_pages.extend(f"{doc.metadata.get('source', 'unknown')} page {doc.metadata.get('page', 'unknown')}" for doc in _relevant_docs)
+    if not questions:
+        return [], []
+
+    vectorstore = retriever.vectorstore
+    embeddings = normalize(np.asarray(vectorstore.embeddings.embed_documents(questions), dtype=np.float32))
+    query_embedding = normalize(embeddings.mean(axis=0))
+
+    k = retriever.search_kwargs.get("k", 4) * len(questions)
+    search_filter = {"source": {"$in": relevant_sources}} if relevant_sources else None
+    sub_docs = vectorstore.similarity_search_by_vector(query_embedding.tolist(), k=k, filter=search_filter)
+
+    parent_ids = list(dict.fromkeys(
+        doc.metadata[retriever.id_key] for doc in sub_docs if retriever.id_key in doc.metadata
+    ))
+
+    # Keep the first document of each id, in retrieval order
+    docs_by_id: dict[Optional[str], Document] = {}
+    for doc in retriever.docstore.mget(parent_ids):
+        if doc is not None:
+            docs_by_id.setdefault(doc.metadata.get("id"), doc)
+
+    relevant_docs = list(docs_by_id.values())
+    source_pages = [f"{doc.metadata.get('source', 'unknown')} page {doc.metadata.get('page', 'unknown')}" for doc in relevant_docs]
 
     return relevant_docs, source_pages
 
-def generate_response(query_text: str, relevant_docs: list[Document]) -> str:
+async def generate_response(query_text: str, relevant_docs: list[Document]) -> AsyncIterator[str]:
     """
     Generates a response based on the context provided by relevant documents.
 
+    The response is streamed, so it can be shown as soon as the first tokens are generated.
+
     Args:
         query_text (str): The original query text from the user.
         relevant_docs (list[Document]): A list of documents that provide context for answering the query.
 
-    Returns:
-        str: The generated response text.
+    Yields:
+        str: The next part of the generated response text.
     """
     context_text = "\n\n---\n\n".join(doc.page_content for doc in relevant_docs)
-    prompt = get_prompt(
-        template="""Answer the question based only on the following context:
-
-        {context}
-
-        ---
-
-        Answer the question based on the above context: {question}""",
-        input_variables=["context", "question"]
-    )
-
-    llm = Ollama(model=OLLAMA_MODEL)
-    model = prompt | llm
-    response_text = model.invoke({"context": context_text, "question": query_text})
-    return response_text
+    async for chunk in ANSWER_CHAIN.astream({"context": context_text, "question": query_text}):
+        yield chunk
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,36 @@
+from utils import BloomFilter
+
+ITEMS = [f"docs/file{idx}.pdf:{idx % 7}:{idx % 3}" for idx in range(10000)]
+
+
+def test_no_false_negatives():
+    bloom_filter = BloomFilter(len(ITEMS))
+    bloom_filter.update(ITEMS)
+
+    assert len(bloom_filter) == len(ITEMS)
+    assert all(item in bloom_filter for item in ITEMS)
+
+def test_false_positive_rate():
+    bloom_filter = BloomFilter(len(ITEMS), error_rate=0.01)
+    bloom_filter.update(ITEMS)
+
+    false_positives = sum(f"missing{idx}" in bloom_filter for idx in range(10000))
+
+    assert false_positives < 10000 * 0.02
+
+def test_save_and_load(tmp_path):
+    bloom_filter = BloomFilter(len(ITEMS))
+    bloom_filter.update(ITEMS[:5000])
+    path = str(tmp_path / "filter.bloom")
+
+    bloom_filter.save(path)
+    loaded = BloomFilter.load(path)
+
+    assert len(loaded) == len(bloom_filter)
+    assert loaded.num_bits == bloom_filter.num_bits
+    assert loaded.num_hashes == bloom_filter.num_hashes
+    assert loaded.bits == bloom_filter.bits
+    assert all(item in loaded for item in ITEMS[:5000])
+
+    loaded.add(ITEMS[5000])
+    assert ITEMS[5000] in loaded
@@ -1,9 +1,7 @@
-from env import OLLAMA_MODEL
 from chat_rag import get_rag_chain
-from langchain_community.llms.ollama import Ollama
 from langchain_core.messages import BaseMessage, HumanMessage
 
-from utils import verbose_print
+from utils import get_llm, verbose_print
 
 EVAL_PROMPT = """
 Does the actual response match the expected response? (Answer with 'true' or 'false')
@@ -84,8 +82,7 @@ def query_and_validate(question: str, expected_response: str, chat_history: list
             expected_response=expected_response.strip().lower(), actual_response=response_text
         )
 
-        model = Ollama(model=OLLAMA_MODEL)
-        evaluation_result = model.invoke(formatted_prompt).strip().lower()
+        evaluation_result = get_llm().invoke(formatted_prompt).strip().lower()
 
         verbose_print(formatted_prompt)
         return process_evaluation_result(evaluation_result)
@@ -0,0 +1,116 @@
+import os
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from env import PARENT_DOC_ID
+from populate_database import find_pdf_files, generate_documents_with_metadata, get_documents_to_add_or_update, split_documents
+from utils import BloomFilter
+
+TEXT = " ".join(f"Sentence number {idx} about a topic." for idx in range(300))
+
+
+def test_split_documents_matches_splitting_each_parent():
+    parent_chunk_size, child_chunk_size = 1000, 300
+
+    documents, sub_documents = split_documents(get_documents(), parent_chunk_size, child_chunk_size)
+    expected_documents, expected_sub_documents = split_each_parent(get_documents(), parent_chunk_size, child_chunk_size)
+
+    assert documents == expected_documents
+    assert sub_documents == expected_sub_documents
+    assert all(sub_document.metadata[PARENT_DOC_ID] for sub_document in sub_documents)
+
+def test_split_documents_without_children():
+    documents, sub_documents = split_documents(get_documents(), 500)
+
+    assert documents
+    assert sub_documents == []
+
+def test_find_pdf_files(tmp_path):
+    for path in ["a.pdf", "b.PDF", "c.txt", "sub/d.pdf", "sub/deeper/e.pdf", "sub/f.pdf.txt"]:
+        os.makedirs(os.path.dirname(tmp_path / path), exist_ok=True)
+        (tmp_path / path).touch()
+
+    found = sorted(os.path.relpath(path, tmp_path) for path in find_pdf_files(str(tmp_path)))
+
+    assert found == sorted(["a.pdf", "b.PDF", os.path.join("sub", "d.pdf"), os.path.join("sub", "deeper", "e.pdf")])
+
+def test_find_pdf_files_missing_directory(tmp_path):
+    assert list(find_pdf_files(str(tmp_path / "missing"))) == []
+
+def test_get_documents_to_add_or_update():
+    vectorstore = StubVectorstore({"same": "1", "changed": "1"})
+    documents = [get_chunk("same", "1"), get_chunk("changed", "2"), get_chunk("new", "1")]
+
+    new_documents, updated_documents = get_documents_to_add_or_update(documents, {"same", "changed"}, vectorstore)
+
+    assert [document.metadata["id"] for document in new_documents] == ["new"]
+    assert [document.metadata["id"] for document in updated_documents] == ["changed"]
+
+def test_get_documents_to_add_or_update_false_positive():
+    vectorstore = StubVectorstore({"same": "1"})
+    existing_ids = BloomFilter(10)
+    existing_ids.update(["same", "false positive"])
+
+    new_documents, updated_documents = get_documents_to_add_or_update([get_chunk("same", "1"), get_chunk("false positive", "1")], existing_ids, vectorstore)
+
+    assert [document.metadata["id"] for document in new_documents] == ["false positive"]
+    assert updated_documents == []
+
+def test_get_documents_to_add_or_update_in_batches():
+    ids = [str(idx) for idx in range(25)]
+    vectorstore = StubVectorstore({id: "1" for id in ids})
+    documents = [get_chunk(id, "2" if int(id) % 2 else "1") for id in ids]
+
+    new_documents, updated_documents = get_documents_to_add_or_update(documents, set(ids), vectorstore, chunk_size=10)
+
+    assert [len(batch) for batch in vectorstore.batches] == [10, 10, 5]
+    assert new_documents == []
+    assert [document.metadata["id"] for document in updated_documents] == [id for id in ids if int(id) % 2]
+
+
+class StubVectorstore:
+    """
+    Vectorstore that only supports looking up the hashes of documents, and records the IDs of each lookup.
+    """
+    def __init__(self, hash_by_id: dict[str, str]):
+        self.hash_by_id = hash_by_id
+        self.batches = []
+
+    def get(self, ids: list[str], include: list[str]) -> dict:
+        self.batches.append(ids)
+        found_ids = [id for id in ids if id in self.hash_by_id]
+        return {"ids": found_ids, "metadatas": [{"hash": self.hash_by_id[id]} for id in found_ids]}
+
+def get_chunk(id: str, hash: str) -> Document:
+    return Document(page_content=id, metadata={"id": id, "hash": hash})
+
+def get_documents() -> list[Document]:
+    return [
+        Document(page_content=TEXT, metadata={"source": "docs/a.pdf", "page": 0}),
+        Document(page_content=TEXT[:3000], metadata={"source": "docs/a.pdf", "page": 1}),
+        Document(page_content=TEXT[1000:], metadata={"source": "docs/b.pdf", "page": 0}),
+    ]
+
+def split_each_parent(documents: list[Document], parent_chunk_size: int, child_chunk_size: int) -> tuple[list[Document], list[Document]]:
+    """
+    Splits the documents like split_documents did before, running the child splitter on each parent separately.
+
+    Args:
+        documents (list[Document]): List of documents to split.
+        parent_chunk_size (int): Size of parent chunks.
+        child_chunk_size (int): Size of child chunks.
+
+    Returns:
+        tuple[list[Document], list[Document]]: Tuple containing lists of parent and sub-documents.
+    """
+    parent_text_splitter = RecursiveCharacterTextSplitter(chunk_size=parent_chunk_size)
+    child_text_splitter = RecursiveCharacterTextSplitter(chunk_size=child_chunk_size)
+
+    new_documents = generate_documents_with_metadata(parent_text_splitter.split_documents(documents))
+    sub_documents = []
+
+    for idx, document in enumerate(new_documents):
+        for sub_document in generate_documents_with_metadata(child_text_splitter.split_documents([document]), idx):
+            sub_document.metadata[PARENT_DOC_ID] = document.metadata.get("id")
+            sub_documents.append(sub_document)
+
+    return new_documents, sub_documents
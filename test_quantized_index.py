@@ -0,0 +1,93 @@
+import numpy as np
+from utils.get_quantized_index import QuantizedIndex, normalize
+
+NUM_VECTORS = 5000
+NUM_DIMENSIONS = 256
+NUM_QUERIES = 100
+K = 3
+RESCORE_MULTIPLIER = 4
+
+
+def test_search_recall_close_to_int8_only():
+    vectors, queries = get_clustered_vectors(seed=0)
+    index = build_index(vectors)
+
+    recall = get_recall(index, vectors, queries)
+    int8_recall = get_recall(index, vectors, queries, candidate_fraction=1)
+
+    assert int8_recall >= 0.95
+    assert recall >= int8_recall - 0.05
+
+def test_search_finds_indexed_vector_first():
+    vectors, _ = get_clustered_vectors(seed=1)
+    index = build_index(vectors)
+
+    for idx in range(0, NUM_VECTORS, NUM_VECTORS // 10):
+        assert index.search(vectors[idx], K)[0] == str(idx)
+
+def test_save_and_load(tmp_path):
+    vectors, queries = get_clustered_vectors(seed=2)
+    index = build_index(vectors)
+    path = str(tmp_path / "index")
+
+    index.save(path)
+    index.save(path)  # Replaces the existing index
+    loaded = QuantizedIndex.load(path)
+
+    assert len(loaded) == len(index)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["index"]
+    np.testing.assert_array_equal(loaded.ids, index.ids)
+    np.testing.assert_array_equal(loaded.codes, index.codes)
+    np.testing.assert_array_equal(loaded.bits, index.bits)
+    assert loaded.search(queries[0], K) == index.search(queries[0], K)
+
+def test_search_empty_index():
+    index = QuantizedIndex(np.array([], dtype=str), np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32))
+
+    assert index.search(np.ones(NUM_DIMENSIONS), K) == []
+
+
+def get_clustered_vectors(seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generates normalized vectors around random cluster centers, and queries close to some of the vectors.
+
+    Args:
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Tuple containing the vectors and the queries.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(50, NUM_DIMENSIONS))
+    vectors = centers[rng.integers(0, len(centers), NUM_VECTORS)] + 0.5 * rng.normal(size=(NUM_VECTORS, NUM_DIMENSIONS))
+    queries = vectors[rng.integers(0, NUM_VECTORS, NUM_QUERIES)] + 0.5 * rng.normal(size=(NUM_QUERIES, NUM_DIMENSIONS))
+
+    return normalize(vectors.astype(np.float32)), normalize(queries.astype(np.float32))
+
+def build_index(vectors: np.ndarray) -> QuantizedIndex:
+    codes, scales = QuantizedIndex.quantize(vectors)
+    return QuantizedIndex(np.arange(len(vectors)).astype(str), codes, scales)
+
+def get_recall(index: QuantizedIndex, vectors: np.ndarray, queries: np.ndarray, **search_kwargs) -> float:
+    """
+    Measures recall@K of the retriever's search path against a brute-force cosine search.
+
+    Like QuantizedMultiVectorRetriever, `K * RESCORE_MULTIPLIER` ids are searched in the index and reranked on their float32 vectors.
+
+    Args:
+        index (QuantizedIndex): Index of the vectors.
+        vectors (np.ndarray): The indexed vectors.
+        queries (np.ndarray): Queries to search for.
+        **search_kwargs: Additional arguments for QuantizedIndex.search.
+
+    Returns:
+        float: Fraction of the true K nearest vectors that were found.
+    """
+    found = 0
+    for query in queries:
+        expected = set(np.argsort(-(vectors @ query))[:K])
+        candidates = np.array(index.search(query, K * RESCORE_MULTIPLIER, RESCORE_MULTIPLIER, **search_kwargs)).astype(int)
+        reranked = candidates[np.argsort(-(vectors[candidates] @ query))[:K]]
+        found += len(expected & set(reranked))
+
+    return found / (len(queries) * K)
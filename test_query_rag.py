@@ -1,8 +1,6 @@
-from env import OLLAMA_MODEL
-from query_rag import query_rag
-from langchain_community.llms.ollama import Ollama
+from query_rag import query_rag, StrippedLineListOutputParser
 
-from utils import verbose_print
+from utils import get_llm, verbose_print
 
 EVAL_PROMPT = """
 Does the actual response match the expected response? (Answer with 'true' or 'false')
@@ -36,6 +34,15 @@ def test_regions_include_denmark_as_incorrect():
         expected_response="""Denmark"""
     )
 
+def test_line_list_parser_strips_list_markers():
+    assert StrippedLineListOutputParser().parse("Keywords:\n\n - compute \n* storage\n1. What is S3?\n2) Lambda\n3.5 turbo\n   \n") == [
+        "Keywords:", "compute", "storage", "What is S3?", "Lambda", "3.5 turbo"
+    ]
+
+def test_line_list_parser_crlf():
+    assert StrippedLineListOutputParser().parse("a\r\nb\r\n") == ["a", "b"]
+    assert StrippedLineListOutputParser().parse("Keywords:\r\n\r\n- compute\r\n- storage") == ["Keywords:", "compute", "storage"]
+
 
 def query_and_validate(question: str, expected_response: str) -> bool:
     """
@@ -49,13 +56,13 @@ def query_and_validate(question: str, expected_response: str) -> bool:
         bool: True if actual response matches the expected response, otherwise False.
     """
     try:
-        response_text = query_rag(question).strip().lower()
+        # Bypass the semantic cache, so the current pipeline is evaluated rather than an earlier response
+        response_text = query_rag(question, use_cache=False).strip().lower()
         formatted_prompt = EVAL_PROMPT.format(
             expected_response=expected_response.strip().lower(), actual_response=response_text
         )
 
-        model = Ollama(model=OLLAMA_MODEL)
-        evaluation_result = model.invoke(formatted_prompt).strip().lower()
+        evaluation_result = get_llm().invoke(formatted_prompt).strip().lower()
 
         verbose_print(formatted_prompt)
         return process_evaluation_result(evaluation_result)
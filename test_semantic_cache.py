@@ -0,0 +1,77 @@
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from utils.get_semantic_cache import SemanticCache
+from utils.get_sqlitestore import Sqlitestore
+
+NUM_DIMENSIONS = 64
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeds texts to random vectors, seeded by the lowercase words of the text.
+
+    Texts with the same words in any case and with any punctuation get the same embedding, other texts are unrelated.
+    """
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        seed = sum(ord(char) * (idx + 1) for idx, char in enumerate(" ".join(re.findall(r"\w+", text.lower()))))
+        return np.random.default_rng(seed).normal(size=NUM_DIMENSIONS).tolist()
+
+class ConstantEmbeddings(Embeddings):
+    """
+    Embeds every text to the same vector, so all texts are similar.
+    """
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0] * NUM_DIMENSIONS
+
+
+def test_get_same_and_similar_query(tmp_path):
+    cache = get_cache(tmp_path)
+    cache.set("What is S3?", "answer")
+
+    assert cache.get("What is S3?") == "answer"
+    assert cache.get("what is S3") == "answer"
+    assert cache.get("What is EC2?") is None
+
+def test_get_requires_same_entities(tmp_path):
+    cache = get_cache(tmp_path, ConstantEmbeddings())
+    cache.set("Is S3 limited to a specific region?", "S3 answer")
+
+    assert cache.get("Is Lambda limited to a specific region?") is None
+    assert cache.get("Is S3 available in all regions?") == "S3 answer"
+    assert cache.get("Is s3 limited to one region?") == "S3 answer"
+
+def test_get_ignores_other_namespaces(tmp_path):
+    get_cache(tmp_path, namespace="llama3.1:v1").set("What is S3?", "answer")
+
+    assert get_cache(tmp_path, namespace="llama3.1:v2").get("What is S3?") is None
+    assert get_cache(tmp_path, namespace="llama3.1:v1").get("What is S3?") == "answer"
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = get_cache(tmp_path, ttl=-1)
+    cache.set("What is S3?", "answer")
+
+    assert cache.get("What is S3?") is None
+    assert len(get_cache(tmp_path, ttl=-1)) == 0
+    assert list(Sqlitestore(str(tmp_path / "store"), "cache").yield_keys()) == []
+
+def test_clear(tmp_path):
+    cache = get_cache(tmp_path)
+    cache.set("What is S3?", "answer")
+    get_cache(tmp_path, namespace="other").set("What is S3?", "other answer")
+
+    cache.clear()
+
+    assert cache.get("What is S3?") is None
+    assert len(get_cache(tmp_path)) == 0
+    assert len(get_cache(tmp_path, namespace="other")) == 0
+
+
+def get_cache(tmp_path, embedding_function: Embeddings = FakeEmbeddings(), namespace: str = "", ttl: float = 60) -> SemanticCache:
+    return SemanticCache(Sqlitestore(str(tmp_path / "store"), "cache"), embedding_function, namespace, ttl=ttl)
@@ -0,0 +1,40 @@
+from utils.get_sqlitestore import MAX_QUERY_PARAMETERS, Sqlitestore
+
+
+def test_mget_keeps_order_and_returns_none_for_missing_keys(tmp_path):
+    store = Sqlitestore(str(tmp_path / "store"), "test")
+    store.mset([("a", 1), ("b", {"value": 2}), ("c", [3])])
+
+    assert store.mget(["c", "missing", "a", "b", "a"]) == [[3], None, 1, {"value": 2}, 1]
+    assert store.mget([]) == []
+
+def test_mget_more_keys_than_query_parameters(tmp_path):
+    store = Sqlitestore(str(tmp_path / "store"), "test")
+    keys = [f"key{idx}" for idx in range(MAX_QUERY_PARAMETERS * 2 + 1)]
+    store.mset([(key, idx) for idx, key in enumerate(keys)])
+
+    assert store.mget(list(reversed(keys))) == list(reversed(range(len(keys))))
+
+def test_mdelete(tmp_path):
+    store = Sqlitestore(str(tmp_path / "store"), "test")
+    store.mset([("a", 1), ("b", 2)])
+    store.mdelete(["a", "missing"])
+
+    assert store.mget(["a", "b"]) == [None, 2]
+
+def test_values_persist_after_reopening(tmp_path):
+    path = str(tmp_path / "store")
+    Sqlitestore(path, "test").mset([("a", 1)])
+
+    assert Sqlitestore(path, "test").mget(["a"]) == [1]
+
+def test_yield_keys_with_prefix(tmp_path):
+    store = Sqlitestore(str(tmp_path / "store"), "test")
+    keys = ["a", "ab", "abc", "Ab", "ABC", "ac", "b", "a%", "a%b", "a_", "axb", "a_b"]
+    store.mset([(key, None) for key in keys])
+
+    assert sorted(store.yield_keys("ab")) == ["ab", "abc"]
+    assert sorted(store.yield_keys("a%")) == ["a%", "a%b"]
+    assert sorted(store.yield_keys("a_")) == ["a_", "a_b"]
+    assert sorted(store.yield_keys("x")) == []
+    assert sorted(store.yield_keys()) == sorted(keys)
@@ -1,13 +1,27 @@
 from .get_sqlitestore import get_sqlitestore
 from .get_vectorstore import get_vectorstore
+from .get_quantized_index import get_quantized_index, update_quantized_index, QuantizedMultiVectorRetriever
 from .get_embedding_function import get_embedding_function
+from .get_llm import get_llm
+from .get_semantic_cache import get_semantic_cache
+from .get_file_hash import get_file_hash, set_file_hash
 from .verbose_print import verbose_print
-from .load_json_file import load_json_file
+from .load_json_file import load_json_file, ConfigError
+from .bloom_filter import BloomFilter
 
 __all__ = [
     "get_sqlitestore",
     "get_vectorstore",
+    "get_quantized_index",
+    "update_quantized_index",
+    "QuantizedMultiVectorRetriever",
     "get_embedding_function",
+    "get_llm",
+    "get_semantic_cache",
+    "get_file_hash",
+    "set_file_hash",
     "verbose_print",
-    "load_json_file"
+    "load_json_file",
+    "ConfigError",
+    "BloomFilter"
 ]
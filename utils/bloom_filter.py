@@ -0,0 +1,86 @@
+import hashlib
+import math
+import struct
+from typing import Iterable
+
+class BloomFilter:
+    """
+    Probabilistic set of strings.
+
+    Membership tests may return false positives at roughly `error_rate` (while no more than `capacity`
+    items have been added), but never false negatives. Needs about 14 bits per item at a 0.1% error rate,
+    far less than a Python set of the same strings.
+    """
+    HEADER = struct.Struct("<QQQ")
+
+    num_bits: int
+    num_hashes: int
+    count: int
+    bits: bytearray
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing: derive all bit positions from two 64-bit halves of a single digest
+        h1, h2 = struct.unpack("<QQ", hashlib.blake2b(item.encode(), digest_size=16).digest())
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> None:
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def save(self, path: str) -> None:
+        """
+        Save the filter to a file.
+
+        Args:
+            path (str): Path of the file. An existing file is overwritten.
+        """
+        with open(path, "wb") as file:
+            file.write(self.HEADER.pack(self.num_bits, self.num_hashes, self.count))
+            file.write(self.bits)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        """
+        Load a filter saved with `save`.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            BloomFilter: The loaded filter.
+        """
+        with open(path, "rb") as file:
+            num_bits, num_hashes, count = cls.HEADER.unpack(file.read(cls.HEADER.size))
+            bits = bytearray(file.read())
+
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.num_bits = num_bits
+        bloom_filter.num_hashes = num_hashes
+        bloom_filter.count = count
+        bloom_filter.bits = bits
+
+        return bloom_filter
@@ -1,7 +1,19 @@
-from langchain_community.embeddings.ollama import OllamaEmbeddings
-from env import OLLAMA_EMBEDDING_MODEL
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_ollama import OllamaEmbeddings
+from langchain_core.embeddings import Embeddings
+from env import EMBEDDING_CACHE_PATH, OLLAMA_EMBEDDING_MODEL
 
 
-def get_embedding_function() -> OllamaEmbeddings:
+def get_embedding_function() -> Embeddings:
+    # Embeds all texts of a call in a single request to Ollama's /api/embed endpoint
     embeddings = OllamaEmbeddings(model=OLLAMA_EMBEDDING_MODEL)
-    return embeddings
+
+    # Cache embeddings on disk, keyed by model and text, so unchanged texts are never embedded twice.
+    # The namespace tells these normalized embeddings apart from the ones cached from the older /api/embeddings endpoint
+    return CacheBackedEmbeddings.from_bytes_store(
+        embeddings,
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=f"{OLLAMA_EMBEDDING_MODEL}-embed",
+        query_embedding_cache=True,
+    )
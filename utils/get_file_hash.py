@@ -0,0 +1,55 @@
+import os
+from blake3 import blake3
+from env import DOCSTORE_PATH, FILE_HASHES_TABLE_NAME
+from utils.get_sqlitestore import get_sqlitestore, Sqlitestore
+
+
+def get_file_hashes_store() -> Sqlitestore:
+    """
+    Retrieve the SQLite store caching the hashes of local files.
+
+    Each entry maps a file path to a (size, mtime_ns, hash) tuple, so a cached hash is only used
+    while the file is unchanged on disk.
+
+    Returns:
+        Sqlitestore: SQLite store instance configured for file hashes.
+    """
+    return get_sqlitestore(DOCSTORE_PATH, FILE_HASHES_TABLE_NAME)
+
+def set_file_hash(file_path: str, file_hash: str) -> None:
+    """
+    Cache the hash of a file, e.g. when it was computed while downloading the file.
+
+    Args:
+        file_path (str): Path to the file.
+        file_hash (str): The BLAKE3 hash of the file.
+    """
+    stat = os.stat(file_path)
+    get_file_hashes_store().mset([
+        (file_path, (stat.st_size, stat.st_mtime_ns, file_hash))
+    ])
+
+def get_file_hash(file_path: str) -> str:
+    """
+    Calculate the BLAKE3 hash of a file.
+
+    The cached hash is returned if the file's size and modification time are unchanged.
+    Otherwise the file is memory-mapped, hashed using multiple threads, and the hash is cached.
+
+    Args:
+        file_path (str): Path to the file to hash.
+
+    Returns:
+        str: The BLAKE3 hash of the file.
+    """
+    stat = os.stat(file_path)
+    cached = get_file_hashes_store().mget([file_path])
+    if cached and cached[0] is not None:
+        size, mtime_ns, file_hash = cached[0]
+        if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return file_hash
+
+    file_hash = blake3(max_threads=blake3.AUTO).update_mmap(file_path).hexdigest()
+    set_file_hash(file_path, file_hash)
+
+    return file_hash
@@ -0,0 +1,21 @@
+from functools import lru_cache
+from typing import Any, Mapping
+from env import OLLAMA_MODEL, OLLAMA_NUM_CTX, OLLAMA_NUM_PREDICT
+from langchain_ollama import OllamaLLM
+
+
+class CacheKeyedOllamaLLM(OllamaLLM):
+    """
+    OllamaLLM that is identified by its model and options.
+
+    The LLM cache keys responses by `dict()` of the LLM, which for OllamaLLM is only its type. Responses of different
+    models or options would then be served for each other.
+    """
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return self._default_params
+
+@lru_cache(maxsize=None)
+def get_llm() -> OllamaLLM:
+    # A single instance keeps its HTTP clients, so the keep-alive connections to Ollama are reused across calls
+    return CacheKeyedOllamaLLM(model=OLLAMA_MODEL, num_ctx=OLLAMA_NUM_CTX, num_predict=OLLAMA_NUM_PREDICT)
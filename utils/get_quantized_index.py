@@ -0,0 +1,279 @@
+import math
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Optional, Sequence
+import numpy as np
+from env import HAMMING_CANDIDATE_FRACTION, QUANTIZED_INDEX_PATH, RESCORE_MULTIPLIER
+from langchain.retrievers.multi_vector import MultiVectorRetriever
+from langchain_chroma import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from utils.get_vectorstore import get_vectorstore
+from utils.verbose_print import verbose_print
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale vectors to unit length along the last axis.
+
+    Args:
+        vectors (np.ndarray): A single vector or a matrix with one vector per row.
+
+    Returns:
+        np.ndarray: The normalized vectors. Zero vectors are left as is.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+# Number of set bits in every possible byte, used to compute Hamming distances on packed bits
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+class QuantizedIndex:
+    """
+    In-memory copy of the vectorstore embeddings using binary and int8 scalar quantization.
+
+    Each embedding is normalized and stored as int8 codes with a per-vector scale (max|x| / 127),
+    so the vector is approximately codes * scale. This takes a quarter of the memory of the float32 embeddings.
+    The signs of the codes are also packed into bits (1 bit per dimension) for a coarse Hamming distance search.
+    """
+    ids: np.ndarray
+    codes: np.ndarray
+    scales: np.ndarray
+    bits: np.ndarray
+
+    def __init__(self, ids: np.ndarray, codes: np.ndarray, scales: np.ndarray, bits: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.bits = bits if bits is not None else np.packbits(codes > 0, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def quantize(embeddings: Sequence[Sequence[float]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Quantize embeddings to int8 codes and per-vector scales.
+
+        Args:
+            embeddings (Sequence[Sequence[float]]): Embeddings to quantize.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Tuple containing the int8 codes and the float32 scales.
+        """
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+
+        return codes, scales.astype(np.float32)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore: Chroma, batch_size: int = 5000) -> "QuantizedIndex":
+        """
+        Build the index from all embeddings in the vectorstore.
+
+        Embeddings are fetched and quantized in batches, so the full float32 matrix is never held in memory.
+
+        Args:
+            vectorstore (Chroma): Vectorstore instance.
+            batch_size (int, default 5000): Number of embeddings to fetch in each batch.
+
+        Returns:
+            QuantizedIndex: The quantized index.
+        """
+        ids = []
+        codes = []
+        scales = []
+
+        while True:
+            rows = vectorstore.get(include=["embeddings"], limit=batch_size, offset=len(ids))
+            if not rows["ids"]:
+                break
+            _codes, _scales = cls.quantize(rows["embeddings"])
+            ids.extend(rows["ids"])
+            codes.append(_codes)
+            scales.append(_scales)
+
+        if not ids:
+            return cls(np.array([], dtype=str), np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32))
+
+        return cls(np.array(ids), np.concatenate(codes), np.concatenate(scales))
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        """
+        Load an index saved with `save`. The codes and bits are memory-mapped rather than read into memory.
+
+        Args:
+            path (str): Directory the index was saved to.
+
+        Returns:
+            QuantizedIndex: The quantized index.
+        """
+        bits_path = os.path.join(path, "bits.npy")
+
+        return cls(
+            np.load(os.path.join(path, "ids.npy")),
+            np.load(os.path.join(path, "codes.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "scales.npy")),
+            np.load(bits_path, mmap_mode="r") if os.path.exists(bits_path) else None,
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Save the index to a directory.
+
+        The files are written to a temporary directory next to `path`, which is then renamed to `path`.
+        A failed save leaves any existing index in place, and `path` never holds a partially written index.
+
+        Args:
+            path (str): Directory to save the index to. An existing index is replaced.
+        """
+        path = os.path.abspath(path)
+        tmp_path = tempfile.mkdtemp(prefix=f".{os.path.basename(path)}-", dir=os.path.dirname(path))
+        try:
+            np.save(os.path.join(tmp_path, "ids.npy"), self.ids)
+            np.save(os.path.join(tmp_path, "codes.npy"), self.codes)
+            np.save(os.path.join(tmp_path, "scales.npy"), self.scales)
+            np.save(os.path.join(tmp_path, "bits.npy"), self.bits)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        # A directory can't be renamed over a non-empty one, so the old index is moved aside first
+        old_path = f"{tmp_path}.old"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def search(self, query_embedding: Sequence[float], k: int, rescore_multiplier: int = RESCORE_MULTIPLIER, candidate_fraction: float = HAMMING_CANDIDATE_FRACTION, batch_size: int = 4096) -> list[str]:
+        """
+        Find the ids of the k embeddings with the highest cosine similarity to the query.
+
+        The search runs in two stages:
+        1. The binarized query is compared against the packed bits, keeping the embeddings with the smallest Hamming distance.
+           One bit per dimension is a coarse approximation, so the candidate pool holds `candidate_fraction` of the index
+           (and at least `k * rescore_multiplier` embeddings) to keep recall close to comparing against all int8 codes.
+        2. The candidates are rescored with the float32 query against their int8 codes (q · codes * scale).
+
+        Both stages work in batches to bound the size of the temporary arrays.
+
+        Args:
+            query_embedding (Sequence[float]): Embedding of the query.
+            k (int): Number of ids to return.
+            rescore_multiplier (int, default RESCORE_MULTIPLIER): Minimum number of candidates per id to rescore.
+            candidate_fraction (float, default HAMMING_CANDIDATE_FRACTION): Fraction of the index kept as candidates by the Hamming distance.
+                With 1 every embedding is rescored.
+            batch_size (int, default 4096): Number of embeddings to compare in each batch.
+
+        Returns:
+            list[str]: Ids ordered from most to least similar.
+        """
+        if not len(self) or k <= 0:
+            return []
+
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        num_candidates = max(k * rescore_multiplier, math.ceil(candidate_fraction * len(self)))
+
+        if num_candidates >= len(self):
+            candidates = np.arange(len(self))
+        else:
+            query_bits = np.packbits(query > 0)
+            distances = np.empty(len(self), dtype=np.uint32)
+            for start in range(0, len(self), batch_size):
+                end = start + batch_size
+                distances[start:end] = POPCOUNT[np.bitwise_xor(self.bits[start:end], query_bits)].sum(axis=1, dtype=np.uint32)
+
+            candidates = top_k(-distances.astype(np.int64), num_candidates)
+            candidates.sort()  # Read the memory-mapped codes in order
+
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            scores[start:start + batch_size] = (self.codes[batch] @ query) * self.scales[batch]
+
+        return self.ids[candidates[top_k(scores, k)]].tolist()
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Get the indices of the k highest scores.
+
+    Args:
+        scores (np.ndarray): Scores to rank.
+        k (int): Number of indices to return. Capped at the number of scores.
+
+    Returns:
+        np.ndarray: Indices ordered from highest to lowest score.
+    """
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+class QuantizedMultiVectorRetriever(MultiVectorRetriever):
+    """
+    Multi-vector retriever that searches a QuantizedIndex instead of the vectorstore's own index.
+
+    The `k * rescore_multiplier` closest sub-documents are found in the quantized index (see QuantizedIndex.search) and reranked
+    on their float32 embeddings from the vectorstore, keeping the best `k`. Their parent documents are then
+    looked up in the docstore like MultiVectorRetriever does.
+    """
+    index: QuantizedIndex
+    rescore_multiplier: int = RESCORE_MULTIPLIER
+    candidate_fraction: float = HAMMING_CANDIDATE_FRACTION
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        k = self.search_kwargs.get("k", 4)
+        query_embedding = normalize(np.asarray(self.vectorstore.embeddings.embed_query(query), dtype=np.float32))
+
+        candidate_ids = self.index.search(query_embedding, k * self.rescore_multiplier, self.rescore_multiplier, self.candidate_fraction)
+        if not candidate_ids:
+            return []
+
+        rows = self.vectorstore.get(ids=candidate_ids, include=["embeddings", "metadatas"])
+        scores = normalize(np.asarray(rows["embeddings"], dtype=np.float32)) @ query_embedding
+
+        # Keep the order of the reranked sub-documents when collecting their parent ids
+        ids = []
+        for idx in np.argsort(-scores)[:k]:
+            parent_id = rows["metadatas"][idx].get(self.id_key)
+            if parent_id is not None and parent_id not in ids:
+                ids.append(parent_id)
+
+        docs = self.docstore.mget(ids)
+        return [doc for doc in docs if doc is not None]
+
+@lru_cache(maxsize=None)
+def get_quantized_index() -> QuantizedIndex:
+    """
+    Load the quantized index.
+
+    The index is only saved by populate_database (see update_quantized_index). If it has not been saved,
+    or is being replaced while loading, it is built in memory from the vectorstore instead,
+    so processes reading the index never write it.
+
+    Returns:
+        QuantizedIndex: The quantized index.
+    """
+    try:
+        return QuantizedIndex.load(QUANTIZED_INDEX_PATH)
+    except (OSError, ValueError):
+        verbose_print(f"Could not load the quantized index from '{QUANTIZED_INDEX_PATH}', building it from the vectorstore")
+
+    return QuantizedIndex.from_vectorstore(get_vectorstore())
+
+def update_quantized_index() -> QuantizedIndex:
+    """
+    Rebuild the quantized index from the vectorstore and save it.
+
+    Returns:
+        QuantizedIndex: The rebuilt index.
+    """
+    index = QuantizedIndex.from_vectorstore(get_vectorstore())
+    index.save(QUANTIZED_INDEX_PATH)
+    get_quantized_index.cache_clear()
+
+    return index
@@ -0,0 +1,181 @@
+import hashlib
+import re
+import time
+from functools import lru_cache
+from typing import Any, Optional
+import numpy as np
+from env import DOCSTORE_PATH, OLLAMA_EMBEDDING_MODEL, OLLAMA_MODEL, OLLAMA_NUM_CTX, OLLAMA_NUM_PREDICT, SEMANTIC_CACHE_TABLE_NAME, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_VERSION
+from langchain_core.embeddings import Embeddings
+from utils.get_embedding_function import get_embedding_function
+from utils.get_quantized_index import normalize
+from utils.get_sqlitestore import get_sqlitestore, Sqlitestore
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class SemanticCache:
+    """
+    Cache of query results, looked up by the meaning of the query rather than its exact text.
+
+    Each entry is keyed by the SHA-1 of the namespace and the query text. It holds the namespace, the entities of the
+    query, the normalized query embedding, the cached value and the time it was added. An identical query is found by
+    its key without computing an embedding. Otherwise the query is embedded and compared against all cached embeddings,
+    and the closest entry with the same entities is returned if its cosine similarity is at least `threshold`.
+
+    The namespace identifies what the values depend on (e.g. the model and the prompts), so values cached under another
+    namespace are never returned. Entries older than `ttl` seconds are ignored and removed when the cache is loaded.
+
+    The entries are persisted in a Sqlitestore, so the cache survives restarts.
+    """
+    store: Sqlitestore
+    embedding_function: Embeddings
+    namespace: str
+    threshold: float
+    ttl: float
+    keys: dict[str, int]
+    entities: list[frozenset[str]]
+    embeddings: np.ndarray
+    values: list[Any]
+    created_at: list[float]
+
+    def __init__(
+            self,
+            store: Sqlitestore,
+            embedding_function: Embeddings,
+            namespace: str = "",
+            threshold: float = SEMANTIC_CACHE_THRESHOLD,
+            ttl: float = SEMANTIC_CACHE_TTL
+    ):
+        self.store = store
+        self.embedding_function = embedding_function
+        self.namespace = namespace
+        self.threshold = threshold
+        self.ttl = ttl
+        self.keys = {}
+        self.entities = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.values = []
+        self.created_at = []
+
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _load(self) -> None:
+        keys = list(self.store.yield_keys())
+        expired_keys = []
+        embeddings = []
+
+        for key, (namespace, entities, embedding, value, created_at) in zip(keys, self.store.mget(keys)):
+            if self._is_expired(created_at):
+                expired_keys.append(key)
+                continue
+            if namespace != self.namespace:
+                continue
+            self.keys[key] = len(self.values)
+            self.entities.append(frozenset(entities))
+            embeddings.append(embedding)
+            self.values.append(value)
+            self.created_at.append(created_at)
+
+        if embeddings:
+            self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        if expired_keys:
+            self.store.mdelete(expired_keys)
+
+    def _is_expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _get_key(self, query_text: str) -> str:
+        return hashlib.sha1(f"{self.namespace}\n{query_text}".encode()).hexdigest()
+
+    @staticmethod
+    def _get_entities(query_text: str) -> frozenset[str]:
+        # Capitalized words and words with digits (e.g. "Lambda", "S3", "EC2"), except the first word which is usually capitalized.
+        # Templated questions like "Is S3 ...?" and "Is Lambda ...?" embed almost identically, but must not share answers
+        return frozenset(
+            word.lower() for word in WORD_PATTERN.findall(query_text)[1:]
+            if word[0].isupper() or any(char.isdigit() for char in word)
+        )
+
+    def get(self, query_text: str) -> Optional[Any]:
+        """
+        Look up the cached value of a query.
+
+        Args:
+            query_text (str): The query text.
+
+        Returns:
+            Optional[Any]: The value cached for the same or a similar query, or None if there is none.
+        """
+        if not self.values:
+            return None
+
+        idx = self.keys.get(self._get_key(query_text))
+        if idx is not None and not self._is_expired(self.created_at[idx]):
+            return self.values[idx]
+
+        query_entities = self._get_entities(query_text)
+        query_embedding = normalize(np.asarray(self.embedding_function.embed_query(query_text), dtype=np.float32))
+        similarities = self.embeddings @ query_embedding
+
+        for idx in np.argsort(-similarities):
+            if similarities[idx] < self.threshold:
+                break
+            if self.entities[idx] == query_entities and not self._is_expired(self.created_at[idx]):
+                return self.values[idx]
+
+        return None
+
+    def set(self, query_text: str, value: Any) -> None:
+        """
+        Cache the value of a query, replacing any value cached for the exact same query.
+
+        Args:
+            query_text (str): The query text.
+            value (Any): The value to cache. Must be picklable.
+        """
+        key = self._get_key(query_text)
+        entities = self._get_entities(query_text)
+        embedding = normalize(np.asarray(self.embedding_function.embed_query(query_text), dtype=np.float32))
+        created_at = time.time()
+
+        idx = self.keys.get(key)
+        if idx is None:
+            self.keys[key] = len(self.values)
+            self.entities.append(entities)
+            self.embeddings = np.vstack([self.embeddings.reshape(-1, len(embedding)), embedding])
+            self.values.append(value)
+            self.created_at.append(created_at)
+        else:
+            self.entities[idx] = entities
+            self.embeddings[idx] = embedding
+            self.values[idx] = value
+            self.created_at[idx] = created_at
+
+        self.store.mset([(key, (self.namespace, sorted(entities), embedding.tolist(), value, created_at))])
+
+    def clear(self) -> None:
+        """
+        Remove all entries from the cache, including those of other namespaces.
+        """
+        self.store.mdelete(list(self.store.yield_keys()))
+        self.keys = {}
+        self.entities = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.values = []
+        self.created_at = []
+
+@lru_cache(maxsize=None)
+def get_semantic_cache() -> SemanticCache:
+    """
+    Retrieve the semantic cache of query_rag responses, loading it from the docstore database.
+
+    The responses are cached under the models, their options and SEMANTIC_CACHE_VERSION, so changing any of them
+    stops earlier responses from being reused.
+
+    Returns:
+        SemanticCache: The semantic cache.
+    """
+    namespace = f"{OLLAMA_MODEL}:{OLLAMA_NUM_CTX}:{OLLAMA_NUM_PREDICT}:{OLLAMA_EMBEDDING_MODEL}:v{SEMANTIC_CACHE_VERSION}"
+    return SemanticCache(get_sqlitestore(DOCSTORE_PATH, SEMANTIC_CACHE_TABLE_NAME), get_embedding_function(), namespace)
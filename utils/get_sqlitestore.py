@@ -1,17 +1,37 @@
+from functools import lru_cache
 from typing import Generic, Iterator, Optional, Sequence, TypeVar
 from langchain_core.stores import BaseStore
 from sqlitedict import SqliteDict
 
 V = TypeVar("V")
 
+MAX_QUERY_PARAMETERS = 999
+
+# WAL mode only needs to sync on checkpoints, which makes NORMAL synchronous writes safe
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
 class Sqlitestore(BaseStore[str, Generic[V]]):
     db: SqliteDict
     def __init__(self, path: str, tablename: str):
-        self.db = SqliteDict(path, tablename=tablename, autocommit=True)
-
-    def mget(self, keys: list[str]) -> list[V]:
-
-        return [self.db[key] for key in keys if key in self.db.keys()]
+        # Writes are committed once per mset/mdelete rather than after every key
+        self.db = SqliteDict(path, tablename=tablename, autocommit=False, journal_mode="WAL")
+        for pragma in SQLITE_PRAGMAS:
+            self.db.conn.execute(pragma)
+
+    def mget(self, keys: list[str]) -> list[Optional[V]]:
+        values = {}
+        # Fetch all keys with one query per batch, staying below SQLite's default limit of 999 parameters
+        for start in range(0, len(keys), MAX_QUERY_PARAMETERS):
+            batch = keys[start:start + MAX_QUERY_PARAMETERS]
+            query = f'SELECT key, value FROM "{self.db.tablename}" WHERE key IN ({", ".join("?" * len(batch))})'
+            for key, value in self.db.conn.select(query, tuple(batch)):
+                values[key] = self.db.decode(value)
+
+        return [values.get(key) for key in keys]
 
     def mset(self, key_value_pairs: Sequence[tuple[str, V]]) -> None:
         for key, value in key_value_pairs:
@@ -27,12 +47,16 @@ class Sqlitestore(BaseStore[str, Generic[V]]):
         self.db.commit()
 
     def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
-        if prefix is None:
+        if not prefix:
             yield from self.db.keys()
         else:
-            for key in self.db.keys():
-                if key.startswith(prefix):
-                    yield key
-
+            # A range on the primary key finds the prefixed keys using its index. Unlike LIKE it is case-sensitive
+            # and does not treat % and _ in the prefix as wildcards
+            upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            query = f'SELECT key FROM "{self.db.tablename}" WHERE key >= ? AND key < ?'
+            for (key,) in self.db.conn.select(query, (prefix, upper_bound)):
+                yield key
+
+@lru_cache(maxsize=None)
 def get_sqlitestore(path: str, tablename: str) -> Sqlitestore:
     return Sqlitestore(path, tablename)
@@ -1,9 +1,11 @@
+from functools import lru_cache
 from env import CHROMA_COLLECTION_NAME, CHROMA_PATH
 import chromadb
 from utils.get_embedding_function import get_embedding_function
 from langchain_chroma import Chroma
 
 
+@lru_cache(maxsize=None)
 def get_vectorstore() -> Chroma:
     persistent_client = chromadb.PersistentClient(
         path=CHROMA_PATH,
@@ -1,24 +1,36 @@
-import json
-from typing import Any, Generic, Optional, TypeVar
+from functools import lru_cache
+from typing import Generic, TypeVar
+import orjson
 
 V = TypeVar("V")
 
-def load_json_file(file_path: str) -> Optional[dict[str, Generic[V]]]:
+class ConfigError(Exception):
+    """
+    Raised when a JSON file is missing or cannot be parsed.
+    """
+
+@lru_cache(maxsize=32)
+def load_json_file(file_path: str) -> dict[str, Generic[V]]:
     """
     Load and parse a JSON file.
 
+    The parsed data is cached per path, so the file is only read once per process.
+    The same dictionary is returned on every call and must not be modified.
+    Errors are not cached, so a failed load is retried on the next call.
+
     Args:
         file_path (str): Path to the JSON file.
 
     Returns:
-        Optional[dict[str, V]]: Parsed JSON data as a dictionary, or None if an error occurs.
+        dict[str, V]: Parsed JSON data as a dictionary.
+
+    Raises:
+        ConfigError: If the file does not exist or contains invalid JSON.
     """
     try:
-        with open(file_path, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print(f"Error: The file '{file_path}' was not found.")
-    except json.JSONDecodeError as e:
-        print(f"Error: The file '{file_path}' contains invalid JSON.")
-        print(f"JSON decode error: {str(e)}")
-    return None
+        with open(file_path, "rb") as file:
+            return orjson.loads(file.read())
+    except FileNotFoundError as e:
+        raise ConfigError(f"The file '{file_path}' was not found.") from e
+    except orjson.JSONDecodeError as e:
+        raise ConfigError(f"The file '{file_path}' contains invalid JSON: {e}") from e